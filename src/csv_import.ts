@@ -1,8 +1,8 @@
 import { Database } from "bun:sqlite";
-import { createReadStream } from "node:fs";
-import { createGunzip } from "node:zlib";
 import { statSync } from "node:fs";
-import { parse } from "csv-parse";
+import { StringDecoder } from "node:string_decoder";
+import { parse } from "csv-parse/sync";
+import { gunzipStream } from "./gunzip";
 
 function formatNum(n: number): string {
   if (n >= 1_000_000) return (n / 1_000_000).toFixed(1) + "M";
@@ -10,6 +10,38 @@ function formatNum(n: number): string {
   return String(n);
 }
 
+const QUOTE = 0x22;
+const COMMA = 0x2c;
+// A quoted field may span at most this many lines / characters before the
+// record is treated as an unterminated quote and skipped
+const MAX_RECORD_LINES = 8;
+const MAX_RECORD_CHARS = 64 * 1024;
+
+/**
+ * Scan one physical line and report whether it ends inside a quoted field.
+ * Only a quote at the start of a field opens one; a stray quote elsewhere
+ * (e.g. `pkg"x`) is literal. `inQuotes` is the state carried from the previous
+ * line of the same record.
+ */
+function endsInQuotedField(line: string, inQuotes: boolean): boolean {
+  if (!inQuotes && !line.includes('"')) return false;
+  let fieldStart = !inQuotes;
+  for (let i = 0; i < line.length; i++) {
+    const c = line.charCodeAt(i);
+    if (inQuotes) {
+      if (c !== QUOTE) continue;
+      if (line.charCodeAt(i + 1) === QUOTE) i++; // escaped ""
+      else inQuotes = false;
+    } else if (c === COMMA) {
+      fieldStart = true;
+    } else {
+      if (c === QUOTE && fieldStart) inQuotes = true;
+      fieldStart = false;
+    }
+  }
+  return inQuotes;
+}
+
 export async function importCsv(
   dbPath: string,
   gzPath: string,
@@ -18,72 +50,70 @@ export async function importCsv(
   const db = new Database(dbPath);
   const fileSize = statSync(gzPath).size;
 
+  // Bulk-load settings. The journal stays on disk (WAL) so a crash or kill
+  // mid-import rolls zoo.db back to its last commit; only the fsyncs are dropped.
   db.run("PRAGMA journal_mode = WAL");
   db.run("PRAGMA synchronous = OFF");
-  db.run("PRAGMA cache_size = -64000");
+  db.run("PRAGMA cache_size = -262144");
+  db.run("PRAGMA temp_store = MEMORY");
   db.run("PRAGMA mmap_size = 268435456");
 
-  db.run("DROP TABLE IF EXISTS apks");
-  db.run(`CREATE TABLE apks (
-    sha256       TEXT PRIMARY KEY,
-    sha1         TEXT,
-    md5          TEXT,
-    apk_size     INTEGER,
-    dex_size     INTEGER,
-    dex_date     TEXT,
-    pkg_name     TEXT,
-    vercode      INTEGER,
-    vt_detection INTEGER,
-    vt_scan_date TEXT,
-    markets      TEXT,
-    added        TEXT
-  )`);
-
-  const BATCH_SIZE = 5000;
-  // CSV column order: sha256, sha1, md5, dex_date, apk_size, pkg_name, vercode, vt_detection, vt_scan_date, dex_size, markets [, added]
-  const numCols = withAddedDate ? 12 : 11;
-  const placeholders = Array(numCols).fill("?").join(",");
-  const batchPlaceholders = Array(BATCH_SIZE).fill(`(${placeholders})`).join(",");
-  const cols =
-    "sha256, sha1, md5, dex_date, apk_size, pkg_name, vercode, vt_detection, vt_scan_date, dex_size, markets" +
-    (withAddedDate ? ", added" : "");
-
-  const batchStmt = db.prepare(`INSERT OR IGNORE INTO apks (${cols}) VALUES ${batchPlaceholders}`);
-
-  let rows = 0;
-  let skipped = 0;
-  let batch: (string | number)[][] = [];
-  let compressedRead = 0;
-  const startTime = Date.now();
-  let lastReport = 0;
-
-  const flush = (currentBatch: (string | number)[][]) => {
-    if (currentBatch.length === 0) return;
-    if (currentBatch.length === BATCH_SIZE) {
-      batchStmt.run(...currentBatch.flat());
-    } else {
-      const ph = Array(currentBatch.length).fill(`(${placeholders})`).join(",");
-      db.prepare(`INSERT OR IGNORE INTO apks (${cols}) VALUES ${ph}`).run(...currentBatch.flat());
-    }
-  };
-
-  db.run("BEGIN TRANSACTION");
-
-  await new Promise<void>((resolve, reject) => {
-    const input = createReadStream(gzPath);
-    const gunzip = createGunzip();
-    const parser = parse({
-      columns: false,
-      skip_empty_lines: true,
-      from_line: 2, // skip header
-      relax_column_count: true,
-    });
+  try {
+    db.run("DROP TABLE IF EXISTS apks");
+    db.run(`CREATE TABLE apks (
+      sha256       TEXT PRIMARY KEY,
+      sha1         TEXT,
+      md5          TEXT,
+      apk_size     INTEGER,
+      dex_size     INTEGER,
+      dex_date     TEXT,
+      pkg_name     TEXT,
+      vercode      INTEGER,
+      vt_detection INTEGER,
+      vt_scan_date TEXT,
+      markets      TEXT,
+      added        TEXT
+    )`);
 
-    input.on("data", (chunk: Buffer) => {
-      compressedRead += chunk.length;
-    });
+    // The flat bind array is spread into run(); JavaScriptCore caps a call at
+    // 65,536 arguments, so BATCH_SIZE * numCols must stay below that
+    const BATCH_SIZE = 5000;
+    // CSV column order: sha256, sha1, md5, dex_date, apk_size, pkg_name, vercode, vt_detection, vt_scan_date, dex_size, markets [, added]
+    const numCols = withAddedDate ? 12 : 11;
+    const placeholders = Array(numCols).fill("?").join(",");
+    const batchPlaceholders = Array(BATCH_SIZE).fill(`(${placeholders})`).join(",");
+    const cols =
+      "sha256, sha1, md5, dex_date, apk_size, pkg_name, vercode, vt_detection, vt_scan_date, dex_size, markets" +
+      (withAddedDate ? ", added" : "");
+
+    const batchStmt = db.prepare(
+      `INSERT OR IGNORE INTO apks (${cols}) VALUES ${batchPlaceholders}`,
+    );
+
+    let rows = 0;
+    let skipped = 0;
+    // Same flat bind array approach as the metadata import; INSERT OR IGNORE
+    // leaves sha256 dedup to the primary key, so rows need no pre-filtering.
+    const params = new Array<string | number>(BATCH_SIZE * numCols);
+    let batchRows = 0;
+    let compressedRead = 0;
+    const startTime = Date.now();
+    let lastReport = 0;
 
-    parser.on("data", (record: string[]) => {
+    const flush = () => {
+      if (batchRows === 0) return;
+      if (batchRows === BATCH_SIZE) {
+        batchStmt.run(...params);
+      } else {
+        const ph = Array(batchRows).fill(`(${placeholders})`).join(",");
+        db.prepare(`INSERT OR IGNORE INTO apks (${cols}) VALUES ${ph}`).run(
+          ...params.slice(0, batchRows * numCols),
+        );
+      }
+      batchRows = 0;
+    };
+
+    const addRecord = (record: string[]) => {
       if (record.length < numCols) {
         skipped++;
         return;
@@ -94,21 +124,17 @@ export async function importCsv(
         return;
       }
 
-      const fields = record.slice(0, numCols);
-      // Convert numeric fields (CSV order: sha256, sha1, md5, dex_date, apk_size, pkg_name, vercode, vt_detection, vt_scan_date, dex_size, markets)
-      const row: (string | number)[] = [...fields];
-      row[4] = parseInt(fields[4] ?? "", 10) || 0; // apk_size
-      row[6] = parseInt(fields[6] ?? "", 10) || 0; // vercode
-      row[7] = parseInt(fields[7] ?? "", 10) || 0; // vt_detection
-      row[9] = parseInt(fields[9] ?? "", 10) || 0; // dex_size
-
-      batch.push(row);
+      // CSV order: sha256, sha1, md5, dex_date, apk_size, pkg_name, vercode, vt_detection, vt_scan_date, dex_size, markets
+      const base = batchRows * numCols;
+      for (let i = 0; i < numCols; i++) params[base + i] = record[i] ?? "";
+      params[base + 4] = parseInt(record[4] ?? "", 10) || 0; // apk_size
+      params[base + 6] = parseInt(record[6] ?? "", 10) || 0; // vercode
+      params[base + 7] = parseInt(record[7] ?? "", 10) || 0; // vt_detection
+      params[base + 9] = parseInt(record[9] ?? "", 10) || 0; // dex_size
+      batchRows++;
       rows++;
 
-      if (batch.length >= BATCH_SIZE) {
-        flush(batch);
-        batch = [];
-      }
+      if (batchRows === BATCH_SIZE) flush();
 
       const now = Date.now();
       if (now - lastReport >= 1000) {
@@ -120,43 +146,120 @@ export async function importCsv(
         );
         lastReport = now;
       }
-    });
+    };
 
-    parser.on("end", () => {
-      flush(batch);
-      resolve();
+    // Lines are split by hand; only quoted lines go through csv-parse. AndroZoo rows
+    // are almost never quoted, and a plain split is far cheaper than the streaming parser.
+    const addLine = (line: string) => {
+      if (line.endsWith("\r")) line = line.slice(0, -1);
+      if (line === "") return;
+      if (!line.includes('"')) {
+        addRecord(line.split(","));
+        return;
+      }
+      try {
+        const records: string[][] = parse(line, { relax_column_count: true, relax_quotes: true });
+        for (const record of records) addRecord(record);
+      } catch {
+        skipped++;
+      }
+    };
+
+    db.run("BEGIN TRANSACTION");
+
+    await new Promise<void>((resolve, reject) => {
+      const input = gunzipStream(gzPath, (bytes) => {
+        compressedRead += bytes;
+      });
+      const decoder = new StringDecoder("utf-8");
+      let leftover = "";
+      let header = true;
+      // Lines of a record whose quoted field contains newlines, joined once it closes
+      let pending: string[] = [];
+      let pendingChars = 0;
+
+      const onLine = (line: string) => {
+        if (header) {
+          header = false; // skip header
+          return;
+        }
+        const inQuotes = endsInQuotedField(line, pending.length > 0);
+        if (pending.length === 0 && !inQuotes) {
+          addLine(line);
+          return;
+        }
+        pending.push(line);
+        pendingChars += line.length;
+        if (!inQuotes) {
+          const record = pending.join("\n");
+          pending = [];
+          pendingChars = 0;
+          addLine(record);
+        } else if (pending.length > MAX_RECORD_LINES || pendingChars > MAX_RECORD_CHARS) {
+          dropPending();
+        }
+      };
+
+      // Unterminated quote: skip the line that opened it and re-read the rest on their own
+      const dropPending = () => {
+        skipped++;
+        const rest = pending.slice(1);
+        pending = [];
+        pendingChars = 0;
+        for (const line of rest) onLine(line);
+      };
+
+      const onLines = (lines: string[]) => {
+        for (const line of lines) onLine(line);
+      };
+
+      input.on("data", (chunk: Buffer) => {
+        const lines = (leftover + decoder.write(chunk)).split("\n");
+        leftover = lines.pop() || "";
+        onLines(lines);
+      });
+
+      input.on("end", () => {
+        onLines([leftover + decoder.end()]);
+        while (pending.length > 0) dropPending();
+        flush();
+        resolve();
+      });
+
+      input.on("error", reject);
     });
 
-    parser.on("error", reject);
-    gunzip.on("error", reject);
-    input.on("error", reject);
-    input.pipe(gunzip).pipe(parser);
-  });
-
-  db.run("COMMIT");
-
-  const elapsed = (Date.now() - startTime) / 1000;
-  const rate = Math.round(rows / elapsed);
-  process.stderr.write(
-    `\rImporting CSV... ${formatNum(rows)} rows (100%) ${formatNum(rate)} rows/s\n`,
-  );
-
-  process.stderr.write("Creating indexes...\n");
-  const indexes = [
-    "CREATE INDEX IF NOT EXISTS idx_pkg_name ON apks(pkg_name)",
-    "CREATE INDEX IF NOT EXISTS idx_markets ON apks(markets)",
-    "CREATE INDEX IF NOT EXISTS idx_vt_detection ON apks(vt_detection)",
-    "CREATE INDEX IF NOT EXISTS idx_dex_date ON apks(dex_date)",
-    "CREATE INDEX IF NOT EXISTS idx_apk_size ON apks(apk_size)",
-  ];
-  for (let i = 0; i < indexes.length; i++) {
-    process.stderr.write(`\rCreating indexes... ${i + 1}/${indexes.length}`);
-    db.run(indexes[i] as string);
-  }
-  process.stderr.write(`\rCreating indexes... ${indexes.length}/${indexes.length}\n`);
+    db.run("COMMIT");
 
-  db.run("PRAGMA synchronous = NORMAL");
-  db.close();
+    const elapsed = (Date.now() - startTime) / 1000;
+    const rate = Math.round(rows / elapsed);
+    process.stderr.write(
+      `\rImporting CSV... ${formatNum(rows)} rows (100%) ${formatNum(rate)} rows/s\n`,
+    );
 
-  return { rows, skipped };
+    process.stderr.write("Creating indexes...\n");
+    const indexes = [
+      "CREATE INDEX IF NOT EXISTS idx_pkg_name ON apks(pkg_name)",
+      "CREATE INDEX IF NOT EXISTS idx_markets ON apks(markets)",
+      "CREATE INDEX IF NOT EXISTS idx_vt_detection ON apks(vt_detection)",
+      "CREATE INDEX IF NOT EXISTS idx_dex_date ON apks(dex_date)",
+      "CREATE INDEX IF NOT EXISTS idx_apk_size ON apks(apk_size)",
+    ];
+    for (let i = 0; i < indexes.length; i++) {
+      process.stderr.write(`\rCreating indexes... ${i + 1}/${indexes.length}`);
+      db.run(indexes[i] as string);
+    }
+    process.stderr.write(`\rCreating indexes... ${indexes.length}/${indexes.length}\n`);
+
+    return { rows, skipped };
+  } finally {
+    // The pragmas above are per-connection and end with close(); a failing
+    // ROLLBACK must not replace the import's own error or skip close()
+    try {
+      if (db.inTransaction) db.run("ROLLBACK");
+    } catch {
+      // close() discards the open transaction anyway
+    }
+    db.close();
+  }
 }
@@ -23,13 +23,15 @@ export async function download(opts: {
   items: AsyncIterable<DownloadItem> | Iterable<DownloadItem>;
 }): Promise<void> {
   const apiKey = getApiKey();
-  const maxJobs = Math.min(opts.jobs, 20);
+  // A pool of zero workers would silently download nothing; fall back to the
+  // default for a non-numeric --jobs and clamp the rest to 1..20
+  const maxJobs = Number.isNaN(opts.jobs) ? 4 : Math.max(1, Math.min(opts.jobs, 20));
 
   let total = 0;
   let downloaded = 0;
   let skipped = 0;
   let errors = 0;
-  const active = new Set<Promise<void>>();
+  let active = 0;
 
   const processItem = async (item: DownloadItem) => {
     total++;
@@ -45,6 +47,7 @@ export async function download(opts: {
     }
 
     const url = `${DOWNLOAD_URL}?apikey=${apiKey}&sha256=${item.sha256}`;
+    active++;
     try {
       await downloadFile(url, dest);
       downloaded++;
@@ -55,30 +58,27 @@ export async function download(opts: {
       errors++;
       const reason = e instanceof Error ? e.message : String(e);
       process.stdout.write(JSON.stringify({ sha256: item.sha256, status: "error", reason }) + "\n");
+    } finally {
+      active--;
     }
     reportStatus();
   };
 
   function reportStatus() {
     process.stderr.write(
-      `\rDownloaded ${downloaded}/${total} (${skipped} skipped, ${errors} errors, ${active.size} active)`,
+      `\rDownloaded ${downloaded}/${total} (${skipped} skipped, ${errors} errors, ${active} active)`,
     );
   }
 
-  for await (const item of opts.items) {
-    // Wait if at max concurrency
-    while (active.size >= maxJobs) {
-      await Promise.race(active);
-    }
-
-    const p = processItem(item).then(() => {
-      active.delete(p);
-    });
-    active.add(p);
-  }
-
-  // Wait for remaining
-  await Promise.all(active);
+  // A fixed pool of workers pulls from one shared iterator; async generators
+  // queue concurrent next() calls, so each item is handed to exactly one worker
+  const queue = (async function* () {
+    yield* opts.items;
+  })();
+  const worker = async () => {
+    for await (const item of queue) await processItem(item);
+  };
+  await Promise.all(Array.from({ length: maxJobs }, worker));
   process.stderr.write(
     `\rDownloaded ${downloaded}/${total} (${skipped} skipped, ${errors} errors)        \n`,
   );
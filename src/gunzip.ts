@@ -0,0 +1,48 @@
+import { spawn } from "node:child_process";
+import { createReadStream } from "node:fs";
+import { PassThrough, type Readable } from "node:stream";
+import { createGunzip } from "node:zlib";
+
+// Tried in order; both accept gzip on stdin and write the inflated stream to stdout
+const EXTERNAL_GUNZIP = ["igzip", "pigz"];
+
+/**
+ * Open a gzip file as a stream of decompressed bytes.
+ * Inflates in an external igzip/pigz process when one is on PATH (faster inflate,
+ * on its own core alongside parsing and inserting), otherwise falls back to node:zlib.
+ * `onRead` is called with the size of each compressed chunk read, for progress.
+ */
+export function gunzipStream(gzPath: string, onRead: (bytes: number) => void): Readable {
+  const input = createReadStream(gzPath);
+  input.on("data", (chunk: Buffer) => {
+    onRead(chunk.length);
+  });
+
+  const tool = EXTERNAL_GUNZIP.find((name) => Bun.which(name) !== null);
+  if (!tool) {
+    const gunzip = createGunzip();
+    input.on("error", (err) => gunzip.destroy(err));
+    return input.pipe(gunzip);
+  }
+
+  const proc = spawn(tool, ["-d", "-c"], { stdio: ["pipe", "pipe", "inherit"] });
+  const out = new PassThrough();
+
+  input.on("error", (err) => {
+    proc.kill();
+    out.destroy(err);
+  });
+  // A failing decompressor closes its stdin early; the exit code below reports it
+  proc.stdin.on("error", () => {});
+  proc.on("error", (err) => out.destroy(err));
+  // Only end the output once the process has exited cleanly, so a corrupt
+  // archive surfaces as an error instead of a silently truncated import
+  proc.on("close", (code) => {
+    if (code === 0) out.end();
+    else out.destroy(new Error(`${tool} exited with code ${code}`));
+  });
+
+  input.pipe(proc.stdin);
+  proc.stdout.pipe(out, { end: false });
+  return out;
+}
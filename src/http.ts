@@ -1,6 +1,12 @@
-import { mkdirSync, existsSync, renameSync, unlinkSync, createReadStream } from "node:fs";
+import { mkdirSync, existsSync, renameSync, unlinkSync } from "node:fs";
+import { open, type FileHandle } from "node:fs/promises";
 import { dirname } from "node:path";
 
+// Size of each chunk worker's staging buffer; one write is issued per full buffer
+const WRITE_BATCH_BYTES = 1 << 20;
+// Files below this size are downloaded over a single connection
+const PARALLEL_MIN_BYTES = 8 << 20;
+
 function formatBytes(bytes: number): string {
   if (bytes >= 1_073_741_824) return (bytes / 1_073_741_824).toFixed(1) + " GB";
   if (bytes >= 1_048_576) return (bytes / 1_048_576).toFixed(1) + " MB";
@@ -28,14 +34,35 @@ export interface DownloadResult {
   size?: number;
 }
 
+/** Everything a download needs from a HEAD response, parsed once. */
+export interface RemoteFile {
+  // ETag, or Last-Modified when the server sends no ETag
+  etag: string | null;
+  size: number;
+  acceptRanges: boolean;
+}
+
+/**
+ * HEAD a URL and parse the headers the downloader uses.
+ */
+export async function probe(url: string): Promise<RemoteFile> {
+  const head = await fetch(url, { method: "HEAD" });
+  if (!head.ok) throw new Error(`HEAD ${url}: ${head.status} ${head.statusText}`);
+  return {
+    etag: head.headers.get("etag") ?? head.headers.get("last-modified"),
+    size: parseInt(head.headers.get("content-length") || "0", 10),
+    acceptRanges: head.headers.get("accept-ranges") === "bytes",
+  };
+}
+
 /**
  * Download a file with chunked parallel HTTP Range requests.
- * Each chunk streams to its own temp file, then they're concatenated.
+ * Each chunk streams straight into its byte range of a single temp file.
  */
 export async function downloadChunked(
   url: string,
   destPath: string,
-  opts: { numWorkers?: number; cachedEtag?: string; label?: string } = {},
+  opts: { numWorkers?: number; cachedEtag?: string; label?: string; remote?: RemoteFile } = {},
 ): Promise<DownloadResult> {
   const numWorkers = opts.numWorkers ?? 20;
   const cachedEtag = opts.cachedEtag;
@@ -43,32 +70,33 @@ export async function downloadChunked(
   const dir = dirname(destPath);
   if (!existsSync(dir)) mkdirSync(dir, { recursive: true });
 
-  // HEAD to get size, ETag, range support
-  const head = await fetch(url, { method: "HEAD" });
-  if (!head.ok) throw new Error(`HEAD ${url}: ${head.status} ${head.statusText}`);
-
-  const etag = head.headers.get("etag");
-  const lastModified = head.headers.get("last-modified");
+  // HEAD to get size, ETag, range support (reuse the caller's if it already probed)
+  const { etag, size, acceptRanges } = opts.remote ?? (await probe(url));
   if (cachedEtag && etag && cachedEtag === etag) {
     process.stderr.write("Skipping download (ETag unchanged)\n");
     return { status: "skipped", etag };
   }
 
-  const contentLength = parseInt(head.headers.get("content-length") || "0", 10);
-  const acceptRanges = head.headers.get("accept-ranges");
   const tmpPath = destPath + ".tmp";
 
-  if (!contentLength || acceptRanges !== "bytes" || numWorkers <= 1) {
-    await downloadSingle(url, tmpPath, contentLength, label);
-  } else {
-    await downloadParallel(url, tmpPath, contentLength, numWorkers, label);
+  // Small files finish faster over one stream than with parallel Range setup
+  try {
+    if (!size || size < PARALLEL_MIN_BYTES || !acceptRanges || numWorkers <= 1) {
+      await downloadSingle(url, tmpPath, size, label);
+    } else {
+      await downloadParallel(url, tmpPath, size, etag, numWorkers, label);
+    }
+  } catch (e) {
+    // Don't leave a partial (possibly fully preallocated) temp file behind
+    if (existsSync(tmpPath)) unlinkSync(tmpPath);
+    throw e;
   }
 
   // Atomic rename
   if (existsSync(destPath)) unlinkSync(destPath);
   renameSync(tmpPath, destPath);
 
-  return { status: "ok", etag: etag || lastModified, size: contentLength };
+  return { status: "ok", etag, size };
 }
 
 async function downloadSingle(url: string, destPath: string, contentLength: number, label: string) {
@@ -98,73 +126,164 @@ async function downloadSingle(url: string, destPath: string, contentLength: numb
   reportProgress(label, downloaded, contentLength, startTime, true);
 }
 
+/**
+ * Reserve the full size of a download in one go so parallel writers land in
+ * contiguous, already-allocated blocks. Uses util-linux `fallocate` when it is
+ * available and supported by the filesystem; otherwise the file is just sized
+ * (sparsely) with ftruncate. Running out of space is fatal up front rather
+ * than failing part-way through the transfer.
+ */
+async function preallocate(file: FileHandle, path: string, size: number): Promise<void> {
+  if (Bun.which("fallocate") !== null) {
+    const proc = Bun.spawnSync(["fallocate", "-l", String(size), path], {
+      stderr: "pipe",
+      env: { ...process.env, LC_ALL: "C" },
+    });
+    if (proc.exitCode === 0) return;
+    if (proc.stderr.toString().includes("No space left on device")) {
+      throw new Error(`Not enough disk space for ${path} (${formatBytes(size)})`);
+    }
+  }
+  await file.truncate(size);
+}
+
+/** One Range request of a parallel download; headers are built once when planning. */
+interface Chunk {
+  index: number;
+  start: number;
+  length: number;
+  headers: Record<string, string>;
+}
+
 async function downloadParallel(
   url: string,
   destPath: string,
   totalSize: number,
+  validator: string | null,
   numWorkers: number,
   label: string,
 ) {
+  // If-Range makes the server send the whole body (200) instead of a range if the
+  // file changed since it was probed; that is rejected below instead of being
+  // written at the chunk's offset. Weak ETags are not allowed in If-Range.
+  const ifRange: Record<string, string> =
+    validator && !validator.startsWith("W/") ? { "If-Range": validator } : {};
   const chunkSize = Math.ceil(totalSize / numWorkers);
   let totalDownloaded = 0;
   const startTime = Date.now();
   let lastReport = 0;
 
-  const chunks: { start: number; end: number; index: number }[] = [];
+  const chunks: Chunk[] = [];
   for (let i = 0; i < numWorkers; i++) {
     const start = i * chunkSize;
+    if (start >= totalSize) break;
     const end = Math.min(start + chunkSize - 1, totalSize - 1);
-    chunks.push({ start, end, index: i });
+    chunks.push({
+      index: i,
+      start,
+      length: end - start + 1,
+      headers: { Range: `bytes=${start}-${end}`, ...ifRange },
+    });
   }
 
-  // Each worker streams to its own temp file
-  const chunkPaths = chunks.map((c) => `${destPath}.part${c.index}`);
+  // Aborted on the first failing chunk so the other transfers stop instead of
+  // writing into a file that is about to be closed and removed
+  const controller = new AbortController();
 
-  const downloadChunkToFile = async (chunk: { start: number; end: number; index: number }) => {
-    const chunkPath = chunkPaths[chunk.index] as string;
-    const resp = await fetch(url, {
-      headers: { Range: `bytes=${chunk.start}-${chunk.end}` },
-    });
-    if (!resp.ok && resp.status !== 206) {
-      throw new Error(`Range request failed: ${resp.status}`);
-    }
+  // All workers write into one file, sized up front, at their absolute offsets
+  const file = await open(destPath, "w");
+  try {
+    await preallocate(file, destPath, totalSize);
 
-    const writer = Bun.file(chunkPath).writer();
-    if (!resp.body)
-      throw new Error(`Range request for chunk ${chunk.index}: response body is null`);
-    const reader = resp.body.getReader();
-
-    // eslint-disable-next-line @typescript-eslint/no-unnecessary-condition
-    while (true) {
-      const { done, value } = await reader.read();
-      if (done) break;
-      await writer.write(value);
-      totalDownloaded += value.byteLength;
-      const now = Date.now();
-      if (now - lastReport >= 500) {
-        reportProgress(label, totalDownloaded, totalSize, startTime);
-        lastReport = now;
+    const downloadChunkToFile = async (chunk: Chunk) => {
+      const resp = await fetch(url, { headers: chunk.headers, signal: controller.signal });
+      if (resp.status !== 206) {
+        throw new Error(
+          resp.ok
+            ? `Range request for chunk ${chunk.index}: got 200 (file changed since HEAD?)`
+            : `Range request failed: ${resp.status}`,
+        );
+      }
+      // Content-Range: bytes <start>-<end>/<total>
+      const range = /^bytes (\d+)-(\d+)\/(\d+)$/.exec(resp.headers.get("content-range") ?? "");
+      if (
+        !range ||
+        Number(range[1]) !== chunk.start ||
+        Number(range[2]) !== chunk.start + chunk.length - 1 ||
+        Number(range[3]) !== totalSize
+      ) {
+        throw new Error(
+          `Range request for chunk ${chunk.index}: unexpected Content-Range ` +
+            `${resp.headers.get("content-range") ?? "(none)"} (file size ${totalSize})`,
+        );
       }
-    }
-    await writer.end();
-  };
 
-  // Download all chunks in parallel
-  await Promise.all(chunks.map(downloadChunkToFile));
+      if (!resp.body)
+        throw new Error(`Range request for chunk ${chunk.index}: response body is null`);
+      const reader = resp.body.getReader();
+      let position = chunk.start;
+      let received = 0;
 
-  reportProgress(label, totalDownloaded, totalSize, startTime, true);
+      // Network reads arrive in small pieces; copy them into one reused staging
+      // buffer per worker and write it out whenever it fills
+      const staging = new Uint8Array(WRITE_BATCH_BYTES);
+      let staged = 0;
+      const writeStaged = async () => {
+        if (staged === 0) return;
+        await file.write(staging, 0, staged, position);
+        position += staged;
+        staged = 0;
+      };
 
-  // Concatenate chunk files into final file by streaming each
-  process.stderr.write("Assembling chunks...\n");
-  const outWriter = Bun.file(destPath).writer();
-  for (const chunkPath of chunkPaths) {
-    const stream = createReadStream(chunkPath);
-    for await (const buf of stream) {
-      await outWriter.write(buf as Uint8Array);
-    }
-    unlinkSync(chunkPath);
+      // eslint-disable-next-line @typescript-eslint/no-unnecessary-condition
+      while (true) {
+        const { done, value } = await reader.read();
+        if (done) break;
+        received += value.byteLength;
+        if (received > chunk.length) {
+          throw new Error(`Range request for chunk ${chunk.index}: more data than requested`);
+        }
+        for (let offset = 0; offset < value.byteLength; ) {
+          const n = Math.min(value.byteLength - offset, WRITE_BATCH_BYTES - staged);
+          staging.set(value.subarray(offset, offset + n), staged);
+          staged += n;
+          offset += n;
+          if (staged === WRITE_BATCH_BYTES) await writeStaged();
+        }
+        totalDownloaded += value.byteLength;
+        const now = Date.now();
+        if (now - lastReport >= 500) {
+          reportProgress(label, totalDownloaded, totalSize, startTime);
+          lastReport = now;
+        }
+      }
+      await writeStaged();
+      if (received !== chunk.length) {
+        throw new Error(
+          `Range request for chunk ${chunk.index}: got ${received} of ${chunk.length} bytes`,
+        );
+      }
+    };
+
+    // Download all chunks in parallel; wait for every worker to settle before
+    // the file is closed, and report the failure that triggered the abort
+    const errors: unknown[] = [];
+    await Promise.all(
+      chunks.map(async (chunk) => {
+        try {
+          await downloadChunkToFile(chunk);
+        } catch (e) {
+          errors.push(e);
+          controller.abort();
+        }
+      }),
+    );
+    if (errors.length > 0) throw errors[0];
+  } finally {
+    await file.close();
   }
-  await outWriter.end();
+
+  reportProgress(label, totalDownloaded, totalSize, startTime, true);
 }
 
 /**
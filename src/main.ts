@@ -113,8 +113,8 @@ const statusCommand = defineCommand({
 const queryCommand = defineCommand({
   meta: { description: "Query database (JSONL to stdout)" },
   args: queryArgs,
-  run({ args }) {
-    query(buildQueryOpts(args));
+  async run({ args }) {
+    await query(buildQueryOpts(args));
   },
 });
 
@@ -160,8 +160,14 @@ const listCommand = defineCommand({
 
 const verifyCommand = defineCommand({
   meta: { description: "Verify downloaded APKs match their SHA-256 filenames" },
-  run() {
-    verify();
+  args: {
+    quick: {
+      type: "boolean",
+      description: "Skip hashing APKs whose size and mtime are unchanged since they last verified",
+    },
+  },
+  async run({ args }) {
+    await verify({ quick: !!args.quick });
   },
 });
 
@@ -1,7 +1,8 @@
 import { Database } from "bun:sqlite";
-import { createReadStream } from "node:fs";
-import { createGunzip } from "node:zlib";
 import { statSync } from "node:fs";
+import { availableParallelism } from "node:os";
+import { gunzipStream } from "./gunzip";
+import type { LineBatch, MetadataValues, ParsedBatch } from "./metadata_worker";
 
 function formatNum(n: number): string {
   if (n >= 1_000_000) return (n / 1_000_000).toFixed(1) + "M";
@@ -9,47 +10,9 @@ function formatNum(n: number): string {
   return String(n);
 }
 
-type MetadataValues = (string | number | null)[];
-
-function parseMetadataLine(line: string): MetadataValues | null {
-  try {
-    const obj = JSON.parse(line) as Record<string, unknown>;
-    const pkgName = obj.docid || obj.packageName || obj.backendDocid;
-    if (!pkgName) return null;
-
-    const details = obj.details as Record<string, unknown> | undefined;
-    const appDetails = (details?.appDetails || {}) as Record<string, unknown>;
-
-    const descriptionHtml = obj.descriptionHtml as string | undefined;
-    const descriptionShort = obj.descriptionShort as string | undefined;
-    let description: string | null = descriptionHtml || descriptionShort || null;
-    if (description) {
-      description = description
-        .replace(/<[^>]*>/g, " ")
-        .replace(/\s+/g, " ")
-        .trim();
-    }
-
-    const aggregateRating = obj.aggregateRating as Record<string, unknown> | undefined;
-
-    return [
-      pkgName as string,
-      (appDetails.versionCode as number) || 0,
-      (obj.title as string) || null,
-      (obj.creator as string) || null,
-      description,
-      JSON.stringify(appDetails.permission ?? []),
-      (appDetails.numDownloads as string) || null,
-      (aggregateRating?.starRating as number) || null,
-      (appDetails.uploadDate as string) || null,
-      parseInt(String(appDetails.installationSize), 10) || 0,
-      (obj.az_metadata_date as string) || null,
-      line,
-    ];
-  } catch {
-    return null;
-  }
-}
+// Resolved relative to this module; also passed to `bun build --compile` as an entrypoint
+const WORKER_URL = new URL("./metadata_worker.ts", import.meta.url).href;
+const LINES_PER_TASK = 2000;
 
 export async function importMetadata(
   dbPath: string,
@@ -58,146 +21,208 @@ export async function importMetadata(
   const db = new Database(dbPath);
   const fileSize = statSync(gzPath).size;
 
+  // Same bulk-load settings as the CSV import (see csv_import.ts)
   db.run("PRAGMA journal_mode = WAL");
   db.run("PRAGMA synchronous = OFF");
-  db.run("PRAGMA cache_size = -64000");
+  db.run("PRAGMA cache_size = -262144");
+  db.run("PRAGMA temp_store = MEMORY");
   db.run("PRAGMA mmap_size = 268435456");
 
-  // Create table without primary key for fast bulk insert
-  db.run("DROP TABLE IF EXISTS gp_metadata");
-  db.run(`CREATE TABLE gp_metadata (
-    pkg_name       TEXT,
-    version_code   INTEGER,
-    title          TEXT,
-    creator        TEXT,
-    description    TEXT,
-    permissions    TEXT,
-    num_downloads  TEXT,
-    star_rating    REAL,
-    upload_date    TEXT,
-    install_size   INTEGER,
-    metadata_date  TEXT,
-    raw            TEXT
-  )`);
-
-  const BATCH_SIZE = 10000;
-  const COLS = 12;
-  const placeholders = Array(COLS).fill("?").join(",");
-  const batchPlaceholders = Array(BATCH_SIZE).fill(`(${placeholders})`).join(",");
-  const insertSql = `INSERT INTO gp_metadata
-    (pkg_name, version_code, title, creator, description, permissions,
-     num_downloads, star_rating, upload_date, install_size, metadata_date, raw)
-    VALUES`;
-
-  const batchStmt = db.prepare(`${insertSql} ${batchPlaceholders}`);
-
-  let rows = 0;
-  let skipped = 0;
-  let batch: MetadataValues[] = [];
-  let compressedRead = 0;
-  const startTime = Date.now();
-  let lastReport = 0;
-
-  const flush = (currentBatch: MetadataValues[]) => {
-    if (currentBatch.length === 0) return;
-    if (currentBatch.length === BATCH_SIZE) {
-      batchStmt.run(...currentBatch.flat());
-    } else {
-      const ph = Array(currentBatch.length).fill(`(${placeholders})`).join(",");
-      db.prepare(`${insertSql} ${ph}`).run(...currentBatch.flat());
-    }
-  };
-
-  db.run("BEGIN TRANSACTION");
-
-  await new Promise<void>((resolve, reject) => {
-    const input = createReadStream(gzPath);
-    const gunzip = createGunzip();
-
-    input.on("data", (chunk: Buffer) => {
-      compressedRead += chunk.length;
-    });
-
-    let leftover = "";
-
-    gunzip.on("data", (chunk: Buffer) => {
-      const text = leftover + chunk.toString("utf-8");
-      const lines = text.split("\n");
-      leftover = lines.pop() || "";
-
-      for (const line of lines) {
-        if (line.trim() === "") continue;
-
-        const parsed = parseMetadataLine(line);
-        if (!parsed) {
-          skipped++;
-          continue;
-        }
-
-        batch.push(parsed);
-        rows++;
-
-        if (batch.length >= BATCH_SIZE) {
-          flush(batch);
-          batch = [];
-        }
-
-        const now = Date.now();
-        if (now - lastReport >= 1000) {
-          const elapsed = (now - startTime) / 1000;
-          const rate = Math.round(rows / elapsed);
-          const pct = Math.round((compressedRead / fileSize) * 100);
-          process.stderr.write(
-            `\rImporting metadata... ${formatNum(rows)} rows (${pct}%) ${formatNum(rate)} rows/s`,
-          );
-          lastReport = now;
-        }
+  try {
+    // Create table without primary key for fast bulk insert
+    db.run("DROP TABLE IF EXISTS gp_metadata");
+    db.run(`CREATE TABLE gp_metadata (
+      pkg_name       TEXT,
+      version_code   INTEGER,
+      title          TEXT,
+      creator        TEXT,
+      description    TEXT,
+      permissions    TEXT,
+      num_downloads  TEXT,
+      star_rating    REAL,
+      upload_date    TEXT,
+      install_size   INTEGER,
+      metadata_date  TEXT,
+      raw            TEXT
+    )`);
+
+    // The flat bind array is spread into run(); JavaScriptCore caps a call at
+    // 65,536 arguments, so BATCH_SIZE * COLS must stay below that
+    const BATCH_SIZE = 5000;
+    const COLS = 12;
+    const placeholders = Array(COLS).fill("?").join(",");
+    const batchPlaceholders = Array(BATCH_SIZE).fill(`(${placeholders})`).join(",");
+    const insertSql = `INSERT INTO gp_metadata
+      (pkg_name, version_code, title, creator, description, permissions,
+       num_downloads, star_rating, upload_date, install_size, metadata_date, raw)
+      VALUES`;
+
+    const batchStmt = db.prepare(`${insertSql} ${batchPlaceholders}`);
+
+    let rows = 0;
+    let skipped = 0;
+    // Row values are written straight into one flat bind array, so a full batch
+    // binds without building per-row arrays or flattening them at flush time.
+    const params = new Array<string | number | null>(BATCH_SIZE * COLS);
+    let batchRows = 0;
+    let compressedRead = 0;
+    const startTime = Date.now();
+    let lastReport = 0;
+
+    const flush = () => {
+      if (batchRows === 0) return;
+      if (batchRows === BATCH_SIZE) {
+        batchStmt.run(...params);
+      } else {
+        const ph = Array(batchRows).fill(`(${placeholders})`).join(",");
+        db.prepare(`${insertSql} ${ph}`).run(...params.slice(0, batchRows * COLS));
       }
-    });
-
-    gunzip.on("end", () => {
-      if (leftover.trim()) {
-        const parsed = parseMetadataLine(leftover);
-        if (parsed) {
-          batch.push(parsed);
-          rows++;
-        } else {
-          skipped++;
+      batchRows = 0;
+    };
+
+    // Workers send every column but raw; the original line is kept on this thread
+    const PARSED_COLS = COLS - 1;
+    const push = (values: MetadataValues, offset: number, raw: string) => {
+      const base = batchRows * COLS;
+      for (let i = 0; i < PARSED_COLS; i++) params[base + i] = values[offset + i] ?? null;
+      params[base + PARSED_COLS] = raw;
+      batchRows++;
+      if (batchRows === BATCH_SIZE) flush();
+    };
+
+    const reportProgress = () => {
+      const now = Date.now();
+      if (now - lastReport < 1000) return;
+      const elapsed = (now - startTime) / 1000;
+      const rate = Math.round(rows / elapsed);
+      const pct = Math.round((compressedRead / fileSize) * 100);
+      process.stderr.write(
+        `\rImporting metadata... ${formatNum(rows)} rows (${pct}%) ${formatNum(rate)} rows/s`,
+      );
+      lastReport = now;
+    };
+
+    // Pipeline: gunzip stream -> line batches -> parser workers -> inserts on this thread.
+    // In-flight batches are bounded; the gunzip stream is paused until workers catch up.
+    const numWorkers = Math.max(1, Math.min(availableParallelism() - 2, 8));
+    const maxInFlight = numWorkers * 2;
+    const workers = Array.from({ length: numWorkers }, () => new Worker(WORKER_URL));
+
+    db.run("BEGIN TRANSACTION");
+
+    try {
+      await new Promise<void>((resolve, reject) => {
+        const gunzip = gunzipStream(gzPath, (bytes) => {
+          compressedRead += bytes;
+        });
+
+        let leftover = "";
+        let lines: string[] = [];
+        let inFlight = 0;
+        let nextWorker = 0;
+        let nextBatchId = 0;
+        let ended = false;
+        const linesInFlight = new Map<number, string[]>();
+
+        const dispatch = () => {
+          if (lines.length === 0) return;
+          const id = nextBatchId++;
+          linesInFlight.set(id, lines);
+          const worker = workers[nextWorker++ % numWorkers] as Worker;
+          worker.postMessage({ id, lines } satisfies LineBatch);
+          lines = [];
+          inFlight++;
+          if (inFlight >= maxInFlight) gunzip.pause();
+        };
+
+        const onParsed = (event: MessageEvent<ParsedBatch>) => {
+          const batch = event.data;
+          const batchLines = linesInFlight.get(batch.id) ?? [];
+          linesInFlight.delete(batch.id);
+          for (let r = 0; r < batch.kept.length; r++) {
+            push(batch.values, r * PARSED_COLS, batchLines[batch.kept[r] as number] as string);
+          }
+          rows += batch.kept.length;
+          skipped += batch.skipped;
+          inFlight--;
+          reportProgress();
+
+          if (ended) {
+            if (inFlight === 0) {
+              flush();
+              resolve();
+            }
+          } else if (inFlight < maxInFlight && gunzip.isPaused()) {
+            gunzip.resume();
+          }
+        };
+
+        for (const worker of workers) {
+          worker.onmessage = onParsed;
+          worker.onerror = (event) => {
+            reject(new Error(`Metadata parser worker failed: ${event.message}`));
+          };
         }
-      }
-      flush(batch);
-      resolve();
-    });
-
-    gunzip.on("error", reject);
-    input.on("error", reject);
-    input.pipe(gunzip);
-  });
-
-  db.run("COMMIT");
-
-  const elapsed = (Date.now() - startTime) / 1000;
-  const rate = Math.round(rows / elapsed);
-  process.stderr.write(
-    `\rImporting metadata... ${formatNum(rows)} rows (100%) ${formatNum(rate)} rows/s\n`,
-  );
-
-  // Create indexes after bulk insert
-  process.stderr.write("Creating metadata indexes...\n");
-  const indexes = [
-    "CREATE UNIQUE INDEX IF NOT EXISTS idx_gp_pk ON gp_metadata(pkg_name, version_code, metadata_date)",
-    "CREATE INDEX IF NOT EXISTS idx_gp_pkg_name ON gp_metadata(pkg_name)",
-    "CREATE INDEX IF NOT EXISTS idx_gp_version_code ON gp_metadata(version_code)",
-    "CREATE INDEX IF NOT EXISTS idx_gp_metadata_date ON gp_metadata(metadata_date)",
-  ];
-  for (let i = 0; i < indexes.length; i++) {
-    process.stderr.write(`\rCreating metadata indexes... ${i + 1}/${indexes.length}`);
-    db.run(indexes[i] as string);
-  }
-  process.stderr.write(`\rCreating metadata indexes... ${indexes.length}/${indexes.length}\n`);
 
-  db.run("PRAGMA synchronous = NORMAL");
-  db.close();
+        gunzip.on("data", (chunk: Buffer) => {
+          const text = leftover + chunk.toString("utf-8");
+          const chunkLines = text.split("\n");
+          leftover = chunkLines.pop() || "";
+
+          for (const line of chunkLines) {
+            if (line.trim() === "") continue;
+            lines.push(line);
+            if (lines.length >= LINES_PER_TASK) dispatch();
+          }
+        });
+
+        gunzip.on("end", () => {
+          if (leftover.trim()) lines.push(leftover);
+          dispatch();
+          ended = true;
+          if (inFlight === 0) {
+            flush();
+            resolve();
+          }
+        });
+
+        gunzip.on("error", reject);
+      });
+    } finally {
+      for (const worker of workers) worker.terminate();
+    }
 
-  return { rows, skipped };
+    db.run("COMMIT");
+
+    const elapsed = (Date.now() - startTime) / 1000;
+    const rate = Math.round(rows / elapsed);
+    process.stderr.write(
+      `\rImporting metadata... ${formatNum(rows)} rows (100%) ${formatNum(rate)} rows/s\n`,
+    );
+
+    // Create indexes after bulk insert
+    process.stderr.write("Creating metadata indexes...\n");
+    const indexes = [
+      "CREATE UNIQUE INDEX IF NOT EXISTS idx_gp_pk ON gp_metadata(pkg_name, version_code, metadata_date)",
+      "CREATE INDEX IF NOT EXISTS idx_gp_pkg_name ON gp_metadata(pkg_name)",
+      "CREATE INDEX IF NOT EXISTS idx_gp_version_code ON gp_metadata(version_code)",
+      "CREATE INDEX IF NOT EXISTS idx_gp_metadata_date ON gp_metadata(metadata_date)",
+    ];
+    for (let i = 0; i < indexes.length; i++) {
+      process.stderr.write(`\rCreating metadata indexes... ${i + 1}/${indexes.length}`);
+      db.run(indexes[i] as string);
+    }
+    process.stderr.write(`\rCreating metadata indexes... ${indexes.length}/${indexes.length}\n`);
+
+    return { rows, skipped };
+  } finally {
+    // The pragmas above are per-connection and end with close(); a failing
+    // ROLLBACK must not replace the import's own error or skip close()
+    try {
+      if (db.inTransaction) db.run("ROLLBACK");
+    } catch {
+      // close() discards the open transaction anyway
+    }
+    db.close();
+  }
 }
@@ -0,0 +1,121 @@
+export type MetadataValues = (string | number | null)[];
+
+/** A batch of JSONL lines posted by the importer. */
+export interface LineBatch {
+  id: number;
+  lines: string[];
+}
+
+/**
+ * Parsed rows for one batch, flattened row by row: every gp_metadata column
+ * except raw (11 values per row). The importer still holds the lines, so it
+ * fills in raw itself from `kept`, the indexes of the lines that parsed.
+ */
+export interface ParsedBatch {
+  id: number;
+  values: MetadataValues;
+  kept: number[];
+  skipped: number;
+}
+
+/** Subset of a GP metadata JSONL record that maps onto gp_metadata columns. */
+interface RawMetadata {
+  docid?: string;
+  packageName?: string;
+  backendDocid?: string;
+  title?: string;
+  creator?: string;
+  descriptionHtml?: string;
+  descriptionShort?: string;
+  aggregateRating?: { starRating?: number };
+  details?: {
+    appDetails?: {
+      versionCode?: number;
+      permission?: string[];
+      numDownloads?: string;
+      uploadDate?: string;
+      installationSize?: string | number;
+    };
+  };
+  az_metadata_date?: string;
+}
+
+// Tags and whitespace runs collapse to a single space in one pass
+const HTML_TEXT_RE = /(?:<[^>]*>|\s)+/g;
+
+function toMetadataValues(obj: RawMetadata): MetadataValues | null {
+  try {
+    const pkgName = obj.docid || obj.packageName || obj.backendDocid;
+    if (!pkgName) return null;
+
+    const appDetails = obj.details?.appDetails ?? {};
+
+    let description = obj.descriptionHtml || obj.descriptionShort || null;
+    if (description) description = description.replace(HTML_TEXT_RE, " ").trim();
+
+    const installSize = appDetails.installationSize;
+
+    return [
+      pkgName,
+      appDetails.versionCode || 0,
+      obj.title || null,
+      obj.creator || null,
+      description,
+      JSON.stringify(appDetails.permission ?? []),
+      appDetails.numDownloads || null,
+      obj.aggregateRating?.starRating || null,
+      appDetails.uploadDate || null,
+      (typeof installSize === "number" ? installSize : parseInt(installSize ?? "", 10)) || 0,
+      obj.az_metadata_date || null,
+    ];
+  } catch {
+    return null;
+  }
+}
+
+function parseMetadataLine(line: string): MetadataValues | null {
+  try {
+    return toMetadataValues(JSON.parse(line) as RawMetadata);
+  } catch {
+    return null;
+  }
+}
+
+/**
+ * Decode a whole batch with one JSON.parse over a synthesized array.
+ * Returns null if any line is malformed (or holds more than one value),
+ * in which case the caller falls back to parsing line by line.
+ */
+function parseBatch(lines: string[]): RawMetadata[] | null {
+  try {
+    const objs = JSON.parse(`[${lines.join(",")}]`) as RawMetadata[];
+    return objs.length === lines.length ? objs : null;
+  } catch {
+    return null;
+  }
+}
+
+declare const self: Worker;
+
+// Runs as a worker thread of importMetadata: parses each batch of JSONL lines
+// posted by the importer and posts back the flattened gp_metadata values.
+// Raw lines are not echoed back, which avoids copying them across threads twice.
+self.onmessage = (event: MessageEvent<LineBatch>) => {
+  const { id, lines } = event.data;
+  const values: MetadataValues = [];
+  const kept: number[] = [];
+  let skipped = 0;
+  const objs = parseBatch(lines);
+  for (let i = 0; i < lines.length; i++) {
+    const obj = objs?.[i];
+    const parsed =
+      obj !== undefined ? toMetadataValues(obj) : parseMetadataLine(lines[i] as string);
+    if (!parsed) {
+      skipped++;
+      continue;
+    }
+    for (const v of parsed) values.push(v);
+    kept.push(i);
+  }
+  self.postMessage({ id, values, kept, skipped } satisfies ParsedBatch);
+};
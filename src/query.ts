@@ -1,6 +1,9 @@
 import { Database } from "bun:sqlite";
+import { once } from "node:events";
 import { dbPath } from "./config";
 
+const OUTPUT_CHUNK_CHARS = 64 * 1024;
+
 export interface QueryOpts {
   pkg?: string;
   sha256?: string;
@@ -15,7 +18,7 @@ export interface QueryOpts {
   limit?: number;
 }
 
-export function query(opts: QueryOpts): void {
+export async function query(opts: QueryOpts): Promise<void> {
   const db = new Database(dbPath(), { readonly: true });
 
   const conditions: string[] = [];
@@ -83,10 +86,18 @@ export function query(opts: QueryOpts): void {
     sql = `SELECT a.* FROM apks a ${where} ${limit}`;
   }
 
+  // Rows go out in ~64 KB writes, and the loop waits for stdout to drain when a
+  // slow consumer (jq, download) falls behind, instead of buffering the whole result
   const stmt = db.prepare(sql);
+  let out = "";
   for (const row of stmt.iterate(...params)) {
-    process.stdout.write(JSON.stringify(row) + "\n");
+    out += JSON.stringify(row) + "\n";
+    if (out.length >= OUTPUT_CHUNK_CHARS) {
+      if (!process.stdout.write(out)) await once(process.stdout, "drain");
+      out = "";
+    }
   }
+  if (out) process.stdout.write(out);
 
   db.close();
 }
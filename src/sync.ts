@@ -2,7 +2,7 @@ import { existsSync, readFileSync, writeFileSync } from "node:fs";
 import { createInterface } from "node:readline";
 import { Database } from "bun:sqlite";
 import { ensureDirs, dbPath, getZooHome, getApiKey } from "./config";
-import { downloadChunked, type DownloadResult } from "./http";
+import { downloadChunked, probe, type DownloadResult, type RemoteFile } from "./http";
 import { importCsv } from "./csv_import";
 import { importMetadata } from "./metadata_import";
 
@@ -53,16 +53,12 @@ async function prompt(question: string): Promise<boolean> {
 
 async function checkAndDownload(
   url: string,
+  remote: RemoteFile,
   destPath: string,
   label: string,
   cachedEtag?: string,
 ): Promise<DownloadResult> {
-  // HEAD to check ETag and size
-  const head = await fetch(url, { method: "HEAD" });
-  if (!head.ok) throw new Error(`HEAD ${url}: ${head.status} ${head.statusText}`);
-
-  const etag = head.headers.get("etag");
-  const size = parseInt(head.headers.get("content-length") || "0", 10);
+  const { etag, size } = remote;
 
   // ETag matches — already up to date
   if (cachedEtag && etag && cachedEtag === etag) {
@@ -81,7 +77,7 @@ async function checkAndDownload(
   }
 
   // Download (first time or user confirmed)
-  return downloadChunked(url, destPath, { label, cachedEtag: undefined });
+  return downloadChunked(url, destPath, { label, cachedEtag: undefined, remote });
 }
 
 export async function sync(opts: { withAddedDate: boolean; withMetadata: boolean }): Promise<void> {
@@ -94,18 +90,30 @@ export async function sync(opts: { withAddedDate: boolean; withMetadata: boolean
   const csvUrl = opts.withAddedDate ? CSV_ADDED_URL : CSV_URL;
   const gzPath = `${home}/latest.csv.gz`;
 
+  const metaGzPath = `${home}/gp-metadata-full.jsonl.gz`;
+  const metaUrl = opts.withMetadata ? `${METADATA_URL}?apikey=${getApiKey()}` : undefined;
+
+  // HEAD both files up front in parallel; prompts below still run one at a time
+  const [csvRemote, metaRemote] = await Promise.all([
+    probe(csvUrl),
+    metaUrl ? probe(metaUrl) : undefined,
+  ]);
+
   // Check and download CSV
-  const csvResult = await checkAndDownload(csvUrl, gzPath, "[CSV]", state.csv_etag ?? undefined);
+  const csvResult = await checkAndDownload(
+    csvUrl,
+    csvRemote,
+    gzPath,
+    "[CSV]",
+    state.csv_etag ?? undefined,
+  );
 
   // Check and download metadata (after CSV, since prompts are sequential)
-  let metaGzPath: string | undefined;
   let metaResult: DownloadResult | undefined;
-  if (opts.withMetadata) {
-    const apiKey = getApiKey();
-    metaGzPath = `${home}/gp-metadata-full.jsonl.gz`;
-    const metaUrl = `${METADATA_URL}?apikey=${apiKey}`;
+  if (metaUrl && metaRemote) {
     metaResult = await checkAndDownload(
       metaUrl,
+      metaRemote,
       metaGzPath,
       "[Metadata]",
       state.metadata_etag ?? undefined,
@@ -127,7 +135,7 @@ export async function sync(opts: { withAddedDate: boolean; withMetadata: boolean
   }
 
   // Import metadata if downloaded (or if gz exists but db has no data)
-  if (metaResult && metaGzPath) {
+  if (metaResult) {
     if (metaResult.status === "ok" || !tableExists(db, "gp_metadata")) {
       if (existsSync(metaGzPath)) {
         const importResult = await importMetadata(db, metaGzPath);
@@ -1,27 +1,40 @@
-import { readdirSync, createReadStream } from "node:fs";
+import { existsSync, readdirSync, readFileSync, statSync, writeFileSync } from "node:fs";
 import { join, basename } from "node:path";
-import { createHash } from "node:crypto";
-import { storePath } from "./config";
+import { getZooHome, storePath } from "./config";
 
-/**
- * Walk the store and verify each APK's sha256 matches its filename.
- * Uses streaming hash to avoid loading large APKs into memory.
- */
-export function verify(): void {
-  const store = storePath();
-  let total = 0;
-  let ok = 0;
-  let bad = 0;
-  const pending: Promise<void>[] = [];
+// Files hashed concurrently; bounded so large stores don't exhaust file descriptors
+const VERIFY_JOBS = 8;
 
-  let level1: string[];
+// sha256 -> "size:mtimeMs" of the file when it last hashed correctly
+type VerifyState = Record<string, string>;
+
+function verifyStatePath(): string {
+  return `${getZooHome()}/verify_state.json`;
+}
+
+function loadVerifyState(): VerifyState {
+  const path = verifyStatePath();
+  if (!existsSync(path)) return {};
   try {
-    level1 = readdirSync(store);
+    return JSON.parse(readFileSync(path, "utf-8")) as VerifyState;
   } catch {
-    process.stderr.write("Store directory not found\n");
-    return;
+    return {};
   }
+}
+
+function saveVerifyState(state: VerifyState): void {
+  writeFileSync(verifyStatePath(), JSON.stringify(state) + "\n");
+}
 
+interface StoredApk {
+  sha256: string;
+  path: string;
+}
+
+/**
+ * Yield every APK in the 2-level hex prefix store.
+ */
+function* walkStore(store: string, level1: string[]): Generator<StoredApk> {
   for (const d1 of level1) {
     const p1 = join(store, d1);
     let level2: string[];
@@ -42,51 +55,91 @@ export function verify(): void {
 
       for (const file of files) {
         if (!file.endsWith(".apk")) continue;
-        total++;
-        const expectedSha = basename(file, ".apk");
-        const filePath = join(p2, file);
-
-        // Stream hash to avoid loading entire file into memory
-        const p = new Promise<void>((resolve) => {
-          const hash = createHash("sha256");
-          const stream = createReadStream(filePath);
-          stream.on("data", (chunk: Buffer) => hash.update(chunk));
-          stream.on("end", () => {
-            const actual = hash.digest("hex");
-            if (actual === expectedSha) {
-              ok++;
-            } else {
-              bad++;
-              process.stdout.write(
-                JSON.stringify({
-                  sha256: expectedSha,
-                  actual_sha256: actual,
-                  path: filePath,
-                  status: "mismatch",
-                }) + "\n",
-              );
-            }
-            if ((ok + bad) % 100 === 0) {
-              process.stderr.write(`\rVerified ${ok + bad} (${ok} ok, ${bad} bad)`);
-            }
-            resolve();
-          });
-          stream.on("error", () => {
-            bad++;
-            process.stdout.write(
-              JSON.stringify({ sha256: expectedSha, path: filePath, status: "read_error" }) + "\n",
-            );
-            resolve();
-          });
-        });
-        pending.push(p);
+        yield { sha256: basename(file, ".apk"), path: join(p2, file) };
       }
     }
   }
+}
+
+/**
+ * Stream a file through Bun's native SHA-256 hasher without loading it into memory.
+ */
+async function sha256File(path: string): Promise<string> {
+  const hasher = new Bun.CryptoHasher("sha256");
+  for await (const chunk of Bun.file(path).stream()) {
+    hasher.update(chunk);
+  }
+  return hasher.digest("hex");
+}
+
+/**
+ * Walk the store and verify each APK's sha256 matches its filename.
+ * Every APK is hashed by default. With `quick`, APKs whose size and mtime are
+ * unchanged since they last verified are trusted without reading them; this
+ * does not catch in-place corruption (bit rot, same-size rewrites).
+ */
+export async function verify(opts: { quick: boolean }): Promise<void> {
+  const store = storePath();
+  let ok = 0;
+  let bad = 0;
+  let cached = 0;
+  const previous: VerifyState = opts.quick ? loadVerifyState() : {};
+  const state: VerifyState = {};
+
+  let level1: string[];
+  try {
+    level1 = readdirSync(store);
+  } catch {
+    process.stderr.write("Store directory not found\n");
+    return;
+  }
+
+  const apks = walkStore(store, level1);
+
+  const worker = async () => {
+    for (const apk of apks) {
+      let fingerprint: string;
+      let actual: string;
+      try {
+        const stat = statSync(apk.path);
+        fingerprint = `${stat.size}:${stat.mtimeMs}`;
+        if (previous[apk.sha256] === fingerprint) {
+          state[apk.sha256] = fingerprint;
+          ok++;
+          cached++;
+          continue;
+        }
+        actual = await sha256File(apk.path);
+      } catch {
+        bad++;
+        process.stdout.write(
+          JSON.stringify({ sha256: apk.sha256, path: apk.path, status: "read_error" }) + "\n",
+        );
+        continue;
+      }
+
+      // AndroZoo publishes upper-case hashes; the store uses lower-case filenames
+      if (actual === apk.sha256.toLowerCase()) {
+        state[apk.sha256] = fingerprint;
+        ok++;
+      } else {
+        bad++;
+        process.stdout.write(
+          JSON.stringify({
+            sha256: apk.sha256,
+            actual_sha256: actual,
+            path: apk.path,
+            status: "mismatch",
+          }) + "\n",
+        );
+      }
+      if ((ok + bad) % 100 === 0) {
+        process.stderr.write(`\rVerified ${ok + bad} (${ok} ok, ${bad} bad)`);
+      }
+    }
+  };
 
-  // Wait for all hashing to complete — this is sync-ish since we collected all promises
-  // In practice, verify is called from a sync context, so we attach the final report
-  void Promise.all(pending).then(() => {
-    process.stderr.write(`\rVerified ${total} (${ok} ok, ${bad} bad)\n`);
-  });
+  await Promise.all(Array.from({ length: VERIFY_JOBS }, worker));
+  saveVerifyState(state);
+  process.stderr.write(`\rVerified ${ok + bad} (${ok} ok, ${bad} bad, ${cached} unchanged)\n`);
 }